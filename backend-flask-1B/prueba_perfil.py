@@ -0,0 +1,162 @@
+'''
+prueba_perfil.py
+
+Autoras: Leire Bernárdez Vázquez y Carmen Reiné Rueda
+
+Descripción:
+    Script que prueba el perfilado de peticiones de servidor.py con el cliente de pruebas de Flask,
+    sin necesidad de levantar el servidor ni tener PostgreSQL en marcha.
+
+Pruebas principales:
+    - La cabecera X-Perfil solo tiene efecto para administradores
+    - Las peticiones muestreadas no exponen Server-Timing al cliente
+    - Las peticiones lentas se capturan y no las expulsan las muestras rápidas
+    - GET /admin/perfil devuelve 401 sin sesión y 403 a usuarios no administradores
+
+Notas:
+    - La conexión a PostgreSQL se sustituye por una conexión falsa en memoria.
+
+'''
+
+import os
+from unittest import mock
+
+import psycopg2
+
+
+# ============================================================
+# === CONEXIÓN FALSA A LA BASE DE DATOS ======================
+# ============================================================
+
+class CursorFalso:
+    def __init__(self):
+        self.resultado = None
+
+    def execute(self, sql, params=None):
+        if "FROM usuarios" in sql and params:
+            username = params[0]
+            self.resultado = {"id": 1 if username == "admin" else 2, "es_admin": username == "admin"}
+        elif "COUNT(*)" in sql:
+            self.resultado = (1,)
+        elif "FROM usuarios" in sql:
+            self.resultado = (1,)
+        else:
+            self.resultado = None
+
+    def executemany(self, sql, params):
+        pass
+
+    def fetchone(self):
+        return self.resultado
+
+    def fetchall(self):
+        return [(1, "Hangman", "Puzzle", "Web", 2024, "Ahorcado", "../assets/hangman.png", None)]
+
+    def close(self):
+        pass
+
+
+class ConexionFalsa:
+    def cursor(self, cursor_factory=None):
+        return CursorFalso()
+
+    def commit(self):
+        pass
+
+    def rollback(self):
+        pass
+
+    def close(self):
+        pass
+
+
+def iniciar_sesion(cliente, username):
+    r = cliente.post("/login", json={"username": username, "password": "1234"})
+    assert r.status_code == 200, r.status_code
+
+
+def test_perfil():
+    print("==== PRUEBA DEL PERFILADO DE PETICIONES ====\n")
+
+    os.environ.setdefault("DATABASE_URL", "postgresql://u:p@localhost/portaljuegosdb")
+    with mock.patch.object(psycopg2, "connect", return_value=ConexionFalsa()):
+        import servidor
+
+        server = servidor.server
+        perfil = server.perfil
+        perfil.umbral_ms = 10_000
+
+        usuario = server.app.test_client()
+        admin = server.app.test_client()
+        anonimo = server.app.test_client()
+        iniciar_sesion(usuario, "leire")
+        iniciar_sesion(admin, "admin")
+
+        # ========================================================
+        # ====== X-PERFIL DE UN USUARIO NO ADMINISTRADOR =========
+        # ========================================================
+        print("X-Perfil de un usuario no administrador...")
+        r = usuario.get("/juegos", headers={"X-Perfil": "1"})
+        assert r.status_code == 200
+        assert "Server-Timing" not in r.headers
+        assert not perfil.muestras and not perfil.lentas
+        print("OK: la cabecera se ignora\n")
+
+        # ========================================================
+        # ======= MUESTREO SIN EXPONER SERVER-TIMING =============
+        # ========================================================
+        print("Peticiones muestreadas de usuarios y anónimos...")
+        perfil.muestreo = 1.0
+        r_usuario = usuario.get("/juegos", headers={"X-Perfil": "1"})
+        r_login = anonimo.post("/login", json={"username": "leire", "password": "1234"})
+        assert "Server-Timing" not in r_usuario.headers
+        assert "Server-Timing" not in r_login.headers
+        assert len(perfil.muestras) == 2
+        assert all(not m["forzada"] and m["funciones"] is None for m in perfil.muestras)
+        assert "sql" in perfil.muestras[0]["fases_ms"]
+        print("OK: el desglose solo llega al buffer de muestras\n")
+
+        # ========================================================
+        # ============ X-PERFIL DE UN ADMINISTRADOR ==============
+        # ========================================================
+        print("X-Perfil de un administrador...")
+        r = admin.get("/juegos", headers={"X-Perfil": "1"})
+        assert "sql;dur=" in r.headers["Server-Timing"]
+        assert perfil.muestras[-1]["forzada"]
+        assert perfil.muestras[-1]["funciones"]
+        print("OK:", r.headers["Server-Timing"], "\n")
+
+        # ========================================================
+        # ====== LAS MUESTRAS NO EXPULSAN PETICIONES LENTAS ======
+        # ========================================================
+        print("Captura de peticiones lentas...")
+        perfil.umbral_ms = 0
+        usuario.get("/juegos")
+        assert len(perfil.lentas) == 1 and perfil.lentas[0]["lenta"]
+
+        perfil.umbral_ms = 10_000
+        for _ in range(perfil.muestras.maxlen + 10):
+            usuario.get("/juegos")
+        assert len(perfil.muestras) == perfil.muestras.maxlen
+        assert len(perfil.lentas) == 1
+        print("OK: la petición lenta sigue capturada\n")
+
+        # ========================================================
+        # ============= ACCESO A /admin/perfil ===================
+        # ========================================================
+        print("Acceso a /admin/perfil...")
+        perfil.muestreo = 0.0
+        assert server.app.test_client().get("/admin/perfil").status_code == 401
+        assert usuario.get("/admin/perfil").status_code == 403
+        r = admin.get("/admin/perfil")
+        assert r.status_code == 200
+        datos = r.json
+        assert len(datos["lentas"]) == 1
+        assert len(datos["muestras"]) == perfil.muestras.maxlen
+        print("OK: 401 / 403 / 200\n")
+
+    print("PRUEBA FINALIZADA")
+
+
+if __name__ == "__main__":
+    test_perfil()
@@ -22,26 +22,155 @@ Endpoints principales:
     - PUT/juegos/<id>       Editar juego existente (solo admin)
     - DELETE/juegos/<id>    Eliminar juego (solo admin)
     - POST/logout           Cerrar sesión
+    - GET/admin/perfil      Peticiones perfiladas y lentas capturadas (solo admin)
     
 Notas:
     - Asegurarse de tener la base de datos de PostgreSQL con el nombre "portaljuegosdb".
     - La base de datos no se crea desde 0 cada vez que ejecutas este script (si se desea empezarla de 0, hay que
         hacerlo manualmente desde la terminal de PostgreSQL).
     - Cambiar los parámetros de user y password para poder conectarse a la base de datos.
+    - Perfilado de peticiones: un admin puede enviar la cabecera "X-Perfil: 1" para perfilar su petición
+        con cProfile y recibir la cabecera Server-Timing. PERFIL_MUESTREO (0.0-1.0) guarda el desglose por
+        fases de una fracción aleatoria de peticiones. Las peticiones que superan PERFIL_UMBRAL_MS (500 por
+        defecto) se capturan siempre. Cada lista guarda como máximo PERFIL_CAPACIDAD (50) entradas.
     
 '''
-from flask import Flask, request, jsonify, make_response
+from flask import Flask, request, jsonify, make_response, g, has_request_context
 from flask_cors import CORS
+from collections import deque
+from contextlib import contextmanager
+import cProfile
+import io
+import pstats
 import psycopg2
 import psycopg2.extras
+import random
 import secrets
 import os
+import sys
+import time
 import urllib.parse as up
 
 
 user = "leire"
 password = "leire"
 
+# ============================================================
+# === PERFILADO DE PETICIONES ================================
+# ============================================================
+
+@contextmanager
+def medir_fase(nombre):
+    """
+    Acumula en la petición actual el tiempo (ms) empleado en una fase (conexión, SQL, mapeo...).
+    Fuera de una petición no mide nada.
+    """
+    if not has_request_context() or "perfil_fases" not in g:
+        yield
+        return
+
+    inicio = time.perf_counter()
+    try:
+        yield
+    finally:
+        fases = g.perfil_fases
+        fases[nombre] = fases.get(nombre, 0.0) + (time.perf_counter() - inicio) * 1000
+
+
+class RequestProfiler:
+    """
+    Perfilado bajo demanda de peticiones y captura de peticiones lentas en buffers circulares.
+
+    Las fases (conexión, SQL, mapeo, serialización) se miden en todas las peticiones con
+    perf_counter, que cuesta unos microsegundos. Las peticiones muestreadas solo guardan ese
+    desglose; cProfile, que instrumenta cada llamada Python y puede ralentizar mucho la petición,
+    se reserva para las peticiones que un admin fuerza con la cabecera X-Perfil.
+    """
+    def __init__(self, muestreo=0.0, umbral_ms=500.0, capacidad=50, top_funciones=15):
+        self.muestreo = muestreo
+        self.umbral_ms = umbral_ms
+        self.top_funciones = top_funciones
+        # Buffers separados para que las muestras rápidas no expulsen a las peticiones lentas
+        self.lentas = deque(maxlen=capacidad)
+        self.muestras = deque(maxlen=capacidad)
+
+    def iniciar(self, forzado=False):
+        """
+        Empieza a medir la petición actual y decide si entra en el muestreo.
+        """
+        g.perfil_inicio = time.perf_counter()
+        g.perfil_fases = {}
+        g.perfil_forzado = forzado
+        g.perfil_muestreada = forzado or (self.muestreo > 0 and random.random() < self.muestreo)
+        g.perfil_cprofile = None
+
+        # No se pisa un perfilador ya instalado en el hilo (depurador, otro profiler...)
+        if forzado and sys.getprofile() is None:
+            profiler = cProfile.Profile()
+            profiler.enable()
+            g.perfil_cprofile = profiler
+
+    def finalizar(self, response):
+        """
+        Cierra la medición y guarda la petición si es lenta o ha sido muestreada.
+        Solo las peticiones forzadas por un admin reciben la cabecera Server-Timing.
+        """
+        if "perfil_inicio" not in g:
+            return response
+
+        total_ms = (time.perf_counter() - g.perfil_inicio) * 1000
+        profiler = g.perfil_cprofile
+        if profiler is not None:
+            profiler.disable()
+
+        lenta = total_ms >= self.umbral_ms
+        if not lenta and not g.perfil_muestreada:
+            return response
+
+        fases = {nombre: round(ms, 3) for nombre, ms in g.perfil_fases.items()}
+        fases["otros"] = round(max(total_ms - sum(g.perfil_fases.values()), 0.0), 3)
+
+        registro = {
+            "metodo": request.method,
+            "ruta": request.path,
+            "estado": response.status_code,
+            "inicio": time.time() - total_ms / 1000,
+            "total_ms": round(total_ms, 3),
+            "fases_ms": fases,
+            "lenta": lenta,
+            "forzada": g.perfil_forzado,
+            "funciones": None
+        }
+
+        if profiler is not None:
+            salida = io.StringIO()
+            stats = pstats.Stats(profiler, stream=salida)
+            stats.sort_stats("cumulative").print_stats(self.top_funciones)
+            registro["funciones"] = salida.getvalue()
+
+        if g.perfil_forzado:
+            response.headers["Server-Timing"] = ", ".join(
+                [f"{nombre};dur={ms}" for nombre, ms in fases.items()] +
+                [f"total;dur={registro['total_ms']}"]
+            )
+
+        # deque.append es atómico: no hace falta lock entre hilos
+        if lenta:
+            self.lentas.append(registro)
+        else:
+            self.muestras.append(registro)
+        return response
+
+    def listar(self):
+        """
+        Devuelve ambas capturas, de la más reciente a la más antigua.
+        """
+        return {
+            "lentas": list(reversed(self.lentas)),
+            "muestras": list(reversed(self.muestras))
+        }
+
+
 # ============================================================
 # === CLASE DE CONEXIÓN A BASE DE DATOS ======================
 # ============================================================
@@ -60,13 +189,14 @@ class Database:
         """
         Devuelve una conexión activa a PostgreSQL.
         """
-        return psycopg2.connect(
-            host=self.host,
-            database=self.db,
-            user=self.user,
-            password=self.password,
-            sslmode="require"
-        )
+        with medir_fase("conexion"):
+            return psycopg2.connect(
+                host=self.host,
+                database=self.db,
+                user=self.user,
+                password=self.password,
+                sslmode="require"
+            )
 
     def init_schema(self):
         """
@@ -235,12 +365,13 @@ class UserService:
     def login(self, username, password):
         conn = self.db.connect()
         cur = conn.cursor(cursor_factory=psycopg2.extras.DictCursor)
-        cur.execute("""
-            SELECT id, es_admin 
-            FROM usuarios 
-            WHERE username=%s AND password=%s;
-        """, (username, password))
-        user = cur.fetchone()
+        with medir_fase("sql"):
+            cur.execute("""
+                SELECT id, es_admin 
+                FROM usuarios 
+                WHERE username=%s AND password=%s;
+            """, (username, password))
+            user = cur.fetchone()
         cur.close()
         conn.close()
 
@@ -289,24 +420,26 @@ class GameService:
     def listar(self):
         conn = self.db.connect()
         cur = conn.cursor()
-        cur.execute("SELECT * FROM juegos ORDER BY id;")
-        rows = cur.fetchall()
+        with medir_fase("sql"):
+            cur.execute("SELECT * FROM juegos ORDER BY id;")
+            rows = cur.fetchall()
         cur.close()
         conn.close()
 
-        return [
-            {
-                "id": r[0],
-                "nombre": r[1],
-                "genero": r[2],
-                "plataforma": r[3],
-                "anio": r[4],
-                "descripcion": r[5],
-                "imagen_ruta": r[6],
-                "wikipedia_url": r[7]
-            }
-            for r in rows
-        ]
+        with medir_fase("mapeo"):
+            return [
+                {
+                    "id": r[0],
+                    "nombre": r[1],
+                    "genero": r[2],
+                    "plataforma": r[3],
+                    "anio": r[4],
+                    "descripcion": r[5],
+                    "imagen_ruta": r[6],
+                    "wikipedia_url": r[7]
+                }
+                for r in rows
+            ]
 
     def crear(self, data):
         conn = self.db.connect()
@@ -363,8 +496,39 @@ class AppServer:
         self.users = UserService(self.db)
         self.games = GameService(self.db)
 
+        self.perfil = RequestProfiler(
+            muestreo=float(os.getenv("PERFIL_MUESTREO", "0")),
+            umbral_ms=float(os.getenv("PERFIL_UMBRAL_MS", "500")),
+            capacidad=int(os.getenv("PERFIL_CAPACIDAD", "50"))
+        )
+
+        self.register_hooks()
         self.register_routes()
 
+    def register_hooks(self):
+        app = self.app
+
+        @app.before_request
+        def iniciar_perfil():
+            # Solo los administradores pueden forzar el perfilado con la cabecera
+            forzado = False
+            if request.headers.get("X-Perfil") == "1":
+                user_info = self.users.authenticate(request)
+                forzado = bool(user_info and user_info["es_admin"])
+            self.perfil.iniciar(forzado)
+
+        @app.after_request
+        def finalizar_perfil(response):
+            return self.perfil.finalizar(response)
+
+        @app.teardown_request
+        def cerrar_perfil(exc):
+            # Red de seguridad: si la excepción se propaga (debug o testing)
+            # after_request no llega a ejecutarse y el perfilador seguiría activo
+            profiler = g.get("perfil_cprofile")
+            if profiler is not None:
+                profiler.disable()
+
     def requiere_autenticacion(self, func):
         def wrapper(*args, **kwargs):
             user_info = self.users.authenticate(request)
@@ -413,7 +577,8 @@ class AppServer:
                 return jsonify({"error": "Credenciales incorrectas"}), 401
 
             # Crea la respuesta con cookie
-            response = jsonify({"message": "Inicio de sesión correcto"})
+            with medir_fase("serializacion"):
+                response = jsonify({"message": "Inicio de sesión correcto"})
             response.set_cookie(
                 "token",
                 token,
@@ -441,7 +606,8 @@ class AppServer:
         @self.requiere_autenticacion
         def listar_juegos():
             juegos = self.games.listar()
-            return jsonify(juegos)
+            with medir_fase("serializacion"):
+                return jsonify(juegos)
 
         # ---------- CREAR JUEGO ----------
         @app.route('/juegos', methods=['POST'])
@@ -530,6 +696,20 @@ class AppServer:
             response.delete_cookie("token")
             return response
 
+        # ---------- PERFILADO DE PETICIONES ----------
+        @app.route('/admin/perfil', methods=['GET'])
+        @self.requiere_autenticacion
+        def ver_perfil():
+            user_info = self.users.authenticate(request)
+            if not user_info or not user_info["es_admin"]:
+                return jsonify({"error": "Solo administradores pueden ver el perfilado"}), 403
+
+            return jsonify({
+                "umbral_ms": self.perfil.umbral_ms,
+                "muestreo": self.perfil.muestreo,
+                **self.perfil.listar()
+            })
+
     # ========================================================
     # === EJECUCIÓN DEL SERVIDOR =============================
     # ========================================================